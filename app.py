@@ -1,6 +1,22 @@
+import os
+
+# Size the OpenMP/MKL thread pools before torch is imported; half the logical
+# CPUs approximates the physical core count on hyperthreaded hosts
+NUM_THREADS = max(1, (os.cpu_count() or 1) // 2)
+os.environ.setdefault('OMP_NUM_THREADS', str(NUM_THREADS))
+os.environ.setdefault('MKL_NUM_THREADS', str(NUM_THREADS))
+
 import streamlit as st
+import contextlib
+import hashlib
 import io
+import math
+import multiprocessing
 import re
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from xml.sax.saxutils import escape as xml_escape
 
 # Set page configuration first
 st.set_page_config(
@@ -10,42 +26,144 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
-# Show loading message
+# Show loading message; the heavy ML and document libraries are imported lazily
+# where they are first used so that simply opening the page stays fast
 with st.spinner("Loading required libraries... This may take a minute on first run."):
     try:
-        import PyPDF2
-        import nltk
-        from transformers import pipeline
-        from sentence_transformers import SentenceTransformer
-        import torch
-        from docx import Document
+        import numpy as np
+        from diskcache import Cache
         import gc
     except ImportError as e:
         st.error(f"Error loading required libraries: {str(e)}")
         st.info("Please try refreshing the page. If the error persists, contact support.")
         st.stop()
 
+# Configure torch thread pools once per process; the interop pool cannot be
+# resized after it has been used, and Streamlit re-executes this script on every rerun
+@st.cache_resource(show_spinner=False)
+def configure_torch_threads():
+    import torch
+    
+    torch.set_num_threads(NUM_THREADS)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass
+
 # Initialize session state
 if 'initialized' not in st.session_state:
     st.session_state.initialized = False
     st.session_state.model_loaded = False
 
+# Question generation model
+QA_MODEL_ID = 'iarfmoose/t5-base-question-generator'
+
+# Sentence encoder used for the diversity pass
+SENTENCE_MODEL_ID = 'all-MiniLM-L6-v2'
+
+# Location of the INT8 ONNX sentence encoder produced by export_onnx.py
+ONNX_MODEL_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'onnx', 'all-MiniLM-L6-v2')
+ONNX_MODEL_FILE = 'model_optimized_quantized.onnx'
+
+# Below this many pages, process pool startup costs more than it saves
+PARALLEL_PAGE_THRESHOLD = 100
+
+# Precompiled patterns for whitespace cleanup and sentence boundaries
+_WS = re.compile(r'\s+')
+_SENT = re.compile(r'(?<=[.!?])\s+(?=[A-Z])')
+_WORD = re.compile(r'[a-z]+')
+
+# Number of top-scoring sentences embedded for the diversity pass
+MAX_CANDIDATES = 30
+
+# Attention cost is quadratic in sequence length; a sentence prefix is enough for similarity
+ENCODER_MAX_SEQ_LENGTH = 96
+ENCODER_MAX_WORDS = 40
+
+# On-disk store of sentence embeddings keyed by sentence hash
+EMBEDDING_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.emb_cache')
+
+class OnnxSentenceEncoder:
+    """Minimal stand-in for SentenceTransformer.encode backed by ONNX Runtime."""
+
+    def __init__(self, model_dir, max_seq_length=256):
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, ONNX_MODEL_FILE),
+            providers=['CPUExecutionProvider']
+        )
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.max_seq_length = max_seq_length
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True,
+               normalize_embeddings=False, show_progress_bar=False):
+        batches = []
+        for start in range(0, len(sentences), batch_size):
+            encoded = self.tokenizer(
+                sentences[start:start + batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors='np'
+            )
+            feeds = {k: v.astype(np.int64) for k, v in encoded.items() if k in self.input_names}
+            token_embeddings = self.session.run(['last_hidden_state'], feeds)[0]
+            
+            # Mean pooling over non-padding tokens, as in the all-MiniLM-L6-v2 pooling layer
+            mask = encoded['attention_mask'][..., None].astype(np.float32)
+            embeddings = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if normalize_embeddings:
+                embeddings /= np.clip(np.linalg.norm(embeddings, axis=1, keepdims=True), 1e-12, None)
+            batches.append(embeddings)
+        return np.concatenate(batches)
+
 # Cache the model loading with memory optimization
 @st.cache_resource(show_spinner=False)
-def load_models():
+def load_models(use_cuda=False):
     try:
-        # Load question generation model with simpler pipeline
-        qa_pipeline = pipeline(
-            'text2text-generation',
-            model='iarfmoose/t5-base-question-generator',
-            device=-1  # Force CPU
-        )
+        from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+        from sentence_transformers import SentenceTransformer
+        import torch
         
-        # Load sentence transformer with memory optimization
-        sentence_model = SentenceTransformer(
-            'all-MiniLM-L6-v2',
-            device='cpu'
-        )
+        configure_torch_threads()
+        
+        # Load question generation model and its fast (Rust) tokenizer directly
+        qa_tokenizer = AutoTokenizer.from_pretrained(QA_MODEL_ID, use_fast=True)
+        qa_model = AutoModelForSeq2SeqLM.from_pretrained(QA_MODEL_ID).eval()
+        if use_cuda:
+            qa_model = qa_model.to('cuda')
+        
+        # Use BetterTransformer's fused attention kernels on GPU when optimum is installed;
+        # the CPU path is INT8-quantized below and keeps the stock attention modules
+        if use_cuda:
+            try:
+                from optimum.bettertransformer import BetterTransformer
+                qa_model = BetterTransformer.transform(qa_model)
+            except Exception:
+                # Missing optimum, version skew or an unsupported config: keep the plain model
+                pass
+        
+        # Quantize all linear layers to INT8 for faster CPU inference
+        if not use_cuda:
+            qa_model = torch.quantization.quantize_dynamic(
+                qa_model,
+                {torch.nn.Linear},
+                dtype=torch.qint8
+            )
+        
+        # Prefer the quantized ONNX sentence encoder on CPU when it has been exported
+        if not use_cuda and os.path.exists(os.path.join(ONNX_MODEL_DIR, ONNX_MODEL_FILE)):
+            sentence_model = OnnxSentenceEncoder(ONNX_MODEL_DIR, max_seq_length=ENCODER_MAX_SEQ_LENGTH)
+        else:
+            # Load sentence transformer with memory optimization
+            sentence_model = SentenceTransformer(
+                SENTENCE_MODEL_ID,
+                device='cuda' if use_cuda else 'cpu'
+            )
+            sentence_model.max_seq_length = ENCODER_MAX_SEQ_LENGTH
         
         # Clear GPU memory if available
         if torch.cuda.is_available():
@@ -54,19 +172,10 @@ def load_models():
         # Run garbage collection
         gc.collect()
         
-        return qa_pipeline, sentence_model
+        return qa_tokenizer, qa_model, sentence_model
     except Exception as e:
         st.error(f"Error loading AI models: {str(e)}")
-        return None, None
-
-# Download required NLTK data
-@st.cache_resource(show_spinner=False)
-def download_nltk_data():
-    try:
-        nltk.data.find('tokenizers/punkt')
-    except LookupError:
-        with st.spinner("Downloading required language data..."):
-            nltk.download('punkt', quiet=True)
+        return None, None, None
 
 # Custom CSS with loading animation
 st.markdown("""
@@ -139,104 +248,222 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 class ExamGenerator:
-    def __init__(self):
+    def __init__(self, use_gpu=False):
+        import torch
+        
+        # Fall back to CPU when no CUDA device is present
+        self.use_cuda = use_gpu and torch.cuda.is_available()
+        
         # Load models with error handling
-        qa_pipeline, sentence_model = load_models()
-        if qa_pipeline is None or sentence_model is None:
+        qa_tokenizer, qa_model, sentence_model = load_models(self.use_cuda)
+        if qa_model is None or sentence_model is None:
             st.error("Failed to initialize AI models. Please try refreshing the page.")
             st.stop()
-        self.qa_pipeline = qa_pipeline
+        self.qa_tokenizer = qa_tokenizer
+        self.qa_model = qa_model
         self.sentence_model = sentence_model
+        self.embedding_cache = Cache(EMBEDDING_CACHE_DIR)
+        
+        # Embeddings differ between encoder backends and settings, so they are part of the cache key
+        if isinstance(sentence_model, OnnxSentenceEncoder):
+            onnx_path = os.path.join(ONNX_MODEL_DIR, ONNX_MODEL_FILE)
+            backend = f"onnx:{ONNX_MODEL_FILE}:{os.path.getmtime(onnx_path)}"
+        else:
+            backend = f"torch:{'cuda:fp16' if self.use_cuda else 'cpu:fp32'}"
+        self.encoder_id = f"{SENTENCE_MODEL_ID}|{backend}|{sentence_model.max_seq_length}"
         
-    def extract_text_from_pdf(self, pdf_file):
+    def extract_text_from_pdf(self, pdf_bytes):
         try:
-            pdf_reader = PyPDF2.PdfReader(pdf_file)
-            text = ""
-            for page in pdf_reader.pages:
-                text += page.extract_text()
-            return text
+            import pypdfium2 as pdfium
+            from pdf_extract import PDFIUM_LOCK, extract_pages, read_pages
+            
+            # Streamlit serves each session from its own thread, so serialize PDFium access
+            with PDFIUM_LOCK:
+                pdf = pdfium.PdfDocument(pdf_bytes)
+                try:
+                    num_pages = len(pdf)
+                    if num_pages < PARALLEL_PAGE_THRESHOLD:
+                        return read_pages(pdf, 0, num_pages)
+                finally:
+                    pdf.close()
+            
+            # Split the pages into one contiguous range per worker process. Workers
+            # must not be forked from the multi-threaded server, and stay within
+            # the same thread budget as torch.
+            num_workers = min(NUM_THREADS, num_pages)
+            bounds = [num_pages * i // num_workers for i in range(num_workers + 1)]
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            with ProcessPoolExecutor(
+                max_workers=num_workers,
+                mp_context=multiprocessing.get_context(start_method)
+            ) as executor:
+                parts = executor.map(extract_pages, repeat(pdf_bytes), bounds[:-1], bounds[1:])
+                return "\n".join(parts)
         except Exception as e:
-            st.error(f"Error reading PDF: {str(e)}")
-            return None
+            raise RuntimeError(f"Error reading PDF: {str(e)}") from e
     
     def preprocess_text(self, text):
         if not text:
             return []
-        # Clean the text
-        text = re.sub(r'\s+', ' ', text)
-        text = text.strip()
+        # Collapse whitespace, split at terminal punctuation followed by a capital
+        # letter, and keep sentences of more than 5 words. Whitespace is already
+        # single spaces here, so the word count is the space count + 1.
+        return [s for s in _SENT.split(_WS.sub(' ', text).strip()) if s.count(' ') >= 5]
+    
+    def _inference_context(self):
+        import torch
+        
+        # Run GPU inference under FP16 autocast; CPU keeps full precision
+        if self.use_cuda:
+            return torch.autocast('cuda', dtype=torch.float16)
+        return contextlib.nullcontext()
+    
+    def _embed(self, texts):
+        # Only a short prefix of each sentence is needed for similarity
+        texts = [" ".join(t.split()[:ENCODER_MAX_WORDS]) for t in texts]
+        
+        # Look up cached embeddings by encoder and content hash and only encode the misses
+        keys = [
+            hashlib.blake2b(f"{self.encoder_id}\n{t}".encode(), digest_size=16).hexdigest()
+            for t in texts
+        ]
+        embeddings = [self.embedding_cache.get(key) for key in keys]
+        misses = [i for i, emb in enumerate(embeddings) if emb is None]
+        
+        if misses:
+            import torch
+            
+            # Encode small inputs in one batch; use wide batches for large ones
+            if self.use_cuda:
+                batch_size = 256
+            elif len(misses) > 64:
+                batch_size = 128
+            else:
+                batch_size = max(8, len(misses))
+            
+            with torch.inference_mode(), self._inference_context():
+                new = self.sentence_model.encode(
+                    [texts[i] for i in misses],
+                    batch_size=batch_size,
+                    convert_to_numpy=True,
+                    normalize_embeddings=True,
+                    show_progress_bar=False
+                )
+            for i, emb in zip(misses, new):
+                self.embedding_cache[keys[i]] = emb
+                embeddings[i] = emb
+        
+        return np.stack(embeddings)
+    
+    def _select_candidates(self, sentences, k):
+        # Score each sentence by length x mean keyword IDF x position in the document
+        tokens = [_WORD.findall(s.lower()) for s in sentences]
+        doc_freq = Counter(word for words in tokens for word in set(words))
+        num_sentences = len(sentences)
+        idf = {word: math.log(num_sentences / df) + 1.0 for word, df in doc_freq.items()}
         
-        # Split into sentences
-        sentences = nltk.sent_tokenize(text)
+        lengths = np.array([len(words) for words in tokens], dtype=np.float64)
+        density = np.array([
+            sum(idf[word] for word in words) / len(words) if words else 0.0
+            for words in tokens
+        ])
+        position = 1.0 - 0.5 * np.arange(num_sentences) / num_sentences
+        scores = lengths * density * position
         
-        # Filter out short sentences and those without important information
-        sentences = [s for s in sentences if len(s.split()) > 5]
-        return sentences
+        # Keep the top k, best first
+        if k < num_sentences:
+            top = np.argpartition(-scores, k)[:k]
+        else:
+            top = np.arange(num_sentences)
+        return [int(i) for i in top[np.argsort(-scores[top])]]
     
     def generate_questions(self, sentences, num_questions=5):
         questions = []
         
-        # Generate embeddings for all sentences
-        embeddings = self.sentence_model.encode(sentences)
+        # Shortlist the most informative sentences so only those are embedded
+        candidates = self._select_candidates(sentences, max(MAX_CANDIDATES, num_questions))
+        embeddings = self._embed([sentences[i] for i in candidates])
         
-        # Select diverse sentences based on embeddings
-        selected_indices = []
-        for _ in range(min(num_questions, len(sentences))):
-            if not selected_indices:
-                selected_indices.append(0)
-            else:
-                # Find the sentence that's most different from already selected ones
-                max_diff = -1
-                max_idx = -1
-                selected_embeddings = embeddings[selected_indices]
-                
-                for i in range(len(sentences)):
-                    if i not in selected_indices:
-                        diff = torch.mean(torch.tensor([
-                            torch.dist(torch.tensor(embeddings[i]), torch.tensor(sel_emb))
-                            for sel_emb in selected_embeddings
-                        ]))
-                        if diff > max_diff:
-                            max_diff = diff
-                            max_idx = i
-                
-                selected_indices.append(max_idx)
+        # Select diverse candidates with farthest-point sampling, starting from the
+        # best-scoring one. With unit vectors dist^2 = 2 - 2 * cos_sim, so the candidate
+        # farthest from its nearest selected neighbour has the lowest max similarity.
+        similarity = embeddings @ embeddings.T
+        idx = 0
+        picks = [idx]
+        max_sim = np.full(len(candidates), -np.inf)
+        for _ in range(min(num_questions, len(candidates)) - 1):
+            np.maximum(max_sim, similarity[idx], out=max_sim)
+            max_sim[idx] = np.inf  # Never pick the same sentence twice
+            idx = int(np.argmin(max_sim))
+            picks.append(idx)
+        selected_indices = [candidates[i] for i in picks]
         
-        # Generate questions for selected sentences
-        for idx in selected_indices:
-            try:
-                qa_input = sentences[idx]
-                # Modified to work with text2text-generation pipeline
-                generated = self.qa_pipeline(
-                    f"generate question: {qa_input}",
+        # Generate questions for all selected sentences in a single batched call
+        inputs = [f"generate question: {sentences[idx]}" for idx in selected_indices]
+        try:
+            import torch
+            
+            encoded = self.qa_tokenizer(
+                inputs,
+                padding=True,
+                truncation=True,
+                max_length=256,
+                return_tensors='pt'
+            ).to(self.qa_model.device)
+            with torch.inference_mode(), self._inference_context():
+                output_ids = self.qa_model.generate(
+                    **encoded,
                     max_length=64,
-                    num_return_sequences=1
+                    num_beams=1,
+                    do_sample=False
                 )
-                if generated and len(generated) > 0:
-                    questions.append({
-                        'question': generated[0]['generated_text'],
-                        'answer': qa_input
-                    })
-            except Exception as e:
-                st.error(f"Error generating question: {str(e)}")
-                continue
+            generated = self.qa_tokenizer.batch_decode(output_ids, skip_special_tokens=True)
+        except Exception as e:
+            raise RuntimeError(f"Error generating questions: {str(e)}") from e
+        
+        for idx, question in zip(selected_indices, generated):
+            if question:
+                questions.append({
+                    'question': question,
+                    'answer': sentences[idx]
+                })
                 
         return questions
     
+    def _add_paragraphs(self, doc, lines):
+        from docx.oxml import parse_xml
+        from docx.oxml.ns import nsdecls
+        
+        # Parse all paragraphs as a single XML fragment instead of one add_paragraph call each
+        paragraphs = "".join(
+            f'<w:p><w:r><w:t xml:space="preserve">{xml_escape(line)}</w:t></w:r></w:p>'
+            for line in lines
+        )
+        fragment = parse_xml(f'<w:body {nsdecls("w")}>{paragraphs}</w:body>')
+        
+        # Paragraphs must precede the body's trailing section properties
+        body = doc.element.body
+        sect_pr = body.sectPr
+        for p in list(fragment):
+            if sect_pr is not None:
+                sect_pr.addprevious(p)
+            else:
+                body.append(p)
+    
     def export_to_word(self, questions):
+        from docx import Document
+        
         doc = Document()
         doc.add_heading('Generated Exam Questions', 0)
         
         # Add questions
         doc.add_heading('Questions:', level=1)
-        for i, q in enumerate(questions, 1):
-            doc.add_paragraph(f"{i}. {q['question']}")
+        self._add_paragraphs(doc, (f"{i}. {q['question']}" for i, q in enumerate(questions, 1)))
             
         # Add answer key
         doc.add_page_break()
         doc.add_heading('Answer Key:', level=1)
-        for i, q in enumerate(questions, 1):
-            doc.add_paragraph(f"{i}. {q['answer']}")
+        self._add_paragraphs(doc, (f"{i}. {q['answer']}" for i, q in enumerate(questions, 1)))
             
         # Save to bytes
         doc_bytes = io.BytesIO()
@@ -244,10 +471,28 @@ class ExamGenerator:
         doc_bytes.seek(0)
         return doc_bytes
 
-def main():
-    # Initialize NLTK data
-    download_nltk_data()
+# Cache the generator so reruns reuse the same instance and loaded models
+@st.cache_resource(show_spinner=False)
+def get_generator(use_gpu=False):
+    return ExamGenerator(use_gpu)
+
+# Memoize the whole PDF-to-questions pipeline on the uploaded bytes and settings.
+# Failures raise and are therefore never cached; only the deterministic
+# "no usable sentences" result (None) and real question lists are stored.
+@st.cache_data(show_spinner=False)
+def run_pipeline(pdf_bytes, num_questions, use_gpu=False):
+    generator = get_generator(use_gpu)
+    
+    # Extract and process text
+    text = generator.extract_text_from_pdf(pdf_bytes)
+    sentences = generator.preprocess_text(text)
+    if not sentences:
+        return None
+    
+    # Generate questions
+    return generator.generate_questions(sentences, num_questions)
 
+def main():
     # Title section with gradient background
     st.markdown('<div class="title-container"><h1>📚 PDF Exam Generator</h1><p>Transform your PDF documents into professional exam questions instantly!</p></div>', unsafe_allow_html=True)
 
@@ -283,6 +528,11 @@ def main():
             value=5,
             help="Select how many questions you want to generate"
         )
+        use_gpu = st.checkbox(
+            "Use GPU if available",
+            value=False,
+            help="Run the AI models on a CUDA GPU; falls back to CPU when none is present"
+        )
 
     if uploaded_file is not None:
         # Create a centered container for the generate button
@@ -293,19 +543,13 @@ def main():
         if generate_button:
             with st.spinner("🔄 Processing PDF and generating questions..."):
                 try:
-                    generator = ExamGenerator()
+                    generator = get_generator(use_gpu)
+                    questions = run_pipeline(uploaded_file.getvalue(), num_questions, use_gpu)
                     
-                    # Extract and process text
-                    text = generator.extract_text_from_pdf(uploaded_file)
-                    sentences = generator.preprocess_text(text)
-                    
-                    if not sentences:
+                    if questions is None:
                         st.markdown('<div class="error-message">❌ Could not extract meaningful text from the PDF. Please try another file.</div>', unsafe_allow_html=True)
                         return
                     
-                    # Generate questions
-                    questions = generator.generate_questions(sentences, num_questions)
-                    
                     if questions:
                         st.markdown(f'<div class="success-message">✅ Successfully generated {len(questions)} questions!</div>', unsafe_allow_html=True)
                         
@@ -0,0 +1,44 @@
+"""Export all-MiniLM-L6-v2 to an optimized, dynamically INT8-quantized ONNX model.
+
+Run once before deploying (requires ``pip install optimum[onnxruntime]``):
+
+    python export_onnx.py
+
+app.py picks up the result from onnx/all-MiniLM-L6-v2/ automatically and falls
+back to the PyTorch SentenceTransformer when it is missing.
+"""
+import os
+
+from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTOptimizer, ORTQuantizer
+from optimum.onnxruntime.configuration import AutoQuantizationConfig, OptimizationConfig
+from transformers import AutoTokenizer
+
+MODEL_ID = 'sentence-transformers/all-MiniLM-L6-v2'
+OUTPUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'onnx', 'all-MiniLM-L6-v2')
+
+
+def main():
+    # Export the PyTorch checkpoint to ONNX
+    model = ORTModelForFeatureExtraction.from_pretrained(MODEL_ID, export=True)
+    tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
+
+    # Apply all ONNX Runtime graph fusions (writes model_optimized.onnx)
+    optimizer = ORTOptimizer.from_pretrained(model)
+    optimizer.optimize(
+        save_dir=OUTPUT_DIR,
+        optimization_config=OptimizationConfig(optimization_level=99)
+    )
+
+    # Dynamic INT8 quantization (writes model_optimized_quantized.onnx)
+    quantizer = ORTQuantizer.from_pretrained(OUTPUT_DIR, file_name='model_optimized.onnx')
+    quantizer.quantize(
+        save_dir=OUTPUT_DIR,
+        quantization_config=AutoQuantizationConfig.avx512_vnni(is_static=False, per_channel=False)
+    )
+
+    tokenizer.save_pretrained(OUTPUT_DIR)
+    print(f"Quantized model saved to {OUTPUT_DIR}")
+
+
+if __name__ == "__main__":
+    main()
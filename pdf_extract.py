@@ -0,0 +1,43 @@
+"""PDF text extraction helpers, importable from worker processes."""
+import re
+import threading
+
+import pypdfium2 as pdfium
+
+# PDFium is not thread-safe; every call into it from this process must hold this lock
+PDFIUM_LOCK = threading.Lock()
+
+# PDFium marks a word hyphenated across a line break with U+FFFE
+_SOFT_HYPHEN = '\ufffe'
+# Characters that are not allowed in XML 1.0 (tab, newline and carriage return are)
+_XML_INVALID = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]')
+
+
+def clean_page_text(text):
+    """Rejoin hyphenated words and replace characters that are invalid in XML with spaces."""
+    return _XML_INVALID.sub(' ', text.replace(_SOFT_HYPHEN, ''))
+
+
+def read_pages(pdf, start, stop):
+    """Return the concatenated text of pages ``start`` to ``stop`` of an open document.
+
+    The caller must hold ``PDFIUM_LOCK``.
+    """
+    parts = []
+    for i in range(start, stop):
+        page = pdf[i]
+        textpage = page.get_textpage()
+        parts.append(clean_page_text(textpage.get_text_range()))
+        textpage.close()
+        page.close()
+    return "\n".join(parts)
+
+
+def extract_pages(pdf_bytes, start, stop):
+    """Open ``pdf_bytes`` and return the text of pages ``start`` to ``stop``."""
+    with PDFIUM_LOCK:
+        pdf = pdfium.PdfDocument(pdf_bytes)
+        try:
+            return read_pages(pdf, start, stop)
+        finally:
+            pdf.close()